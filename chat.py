@@ -2,15 +2,20 @@
 
 import argparse
 import base64
+import dedup
 import filetype
+import history_store
 import json
 import os
+import profiler
 import re
 import requests
+import threading
 import webbrowser
 
 from bs4 import BeautifulSoup
 from collections import deque
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from io import BytesIO
 from prompt_toolkit.history import FileHistory
@@ -22,15 +27,20 @@ from pypdf import PdfReader
 load_dotenv()
 
 # Constants
+BATCH_POLL_INTERVAL_SEC = int(os.getenv("BATCH_POLL_INTERVAL", 30))
 DEFAULT_CHUNK_SIZE = int(os.getenv("DEFAULT_CHUNK_SIZE", 10000))
 DEFAULT_PROMPT = os.getenv("DEFAULT_PROMPT", None)
 DEFAULT_TIMEOUT_SEC = 30
+REQUEST_TIMEOUT_SEC = int(os.getenv("REQUEST_TIMEOUT", 300))
+SKIP_DUPLICATE_CHUNKS = os.getenv(
+        "SKIP_DUPLICATE_CHUNKS", "true").lower() in ("1", "true", "yes")
 INPUT_HISTORY = os.getenv(
         "PROMPT_HISTORY",
         f"{os.path.expanduser('~')}/.chat_prompt_history")
-OUTPUT_HISTORY = os.getenv(
-        "OUTPUT_HISTORY",
-        f"{os.path.expanduser('~')}/.chat_history")
+PREFETCH = os.getenv("PREFETCH", "false").lower() in ("1", "true", "yes")
+PROFILE_REPORT = os.getenv(
+        "PROFILE_REPORT",
+        f"{os.path.expanduser('~')}/.chat_profile")
 REQUEST_DEBUG_LOG = os.getenv(
         "REQUEST_DEBUG_LOG",
         f"{os.path.expanduser('~')}/.chat_request_debug_log")
@@ -41,12 +51,36 @@ USER_AGENT = os.getenv("USER_AGENT", "LLM_Chat_Tool")
 kb = KeyBindings()
 
 
+# Run func on a daemon thread and report through a Future. Unlike an
+# executor worker, an abandoned call never keeps the process from exiting.
+def submit_daemon(func, *args):
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 class Chat():
 
     MODEL = ""
 
     def __init__(self, model):
         self.MODEL = model
+        self.session = requests.Session()
+        self.prefetch = PREFETCH
+        self.dedup = SKIP_DUPLICATE_CHUNKS
+        self.chunk_indexes = {}
+        self.saved_requests = 0
+        # Model that produced the last answer, when it is not self.MODEL
+        self.last_model = None
 
     @kb.add('escape', 'enter')
     def _(event):
@@ -68,6 +102,7 @@ class Chat():
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
+    @profiler.staged('extract')
     def read_pdf(self, byte_stream):
 
         reader = PdfReader(byte_stream)
@@ -80,9 +115,10 @@ class Chat():
         headers = {}
         headers['User-Agent'] = USER_AGENT
         try:
-            response = requests.get(url,
-                                    headers=headers,
-                                    timeout=DEFAULT_TIMEOUT_SEC)
+            with profiler.stage('fetch'):
+                response = self.session.get(url,
+                                            headers=headers,
+                                            timeout=DEFAULT_TIMEOUT_SEC)
             response.raise_for_status()
         except Exception as e:
             print(e)
@@ -95,8 +131,10 @@ class Chat():
         if 'application/pdf' in content_type:
             return self.read_pdf(BytesIO(content)), content_type
         elif 'text/html' in content_type:
-            soup = BeautifulSoup(content, 'html.parser')
-            return soup.get_text(' ', strip=True), content_type
+            with profiler.stage('extract'):
+                soup = BeautifulSoup(content, 'html.parser')
+                text = soup.get_text(' ', strip=True)
+            return text, content_type
         elif 'text/plain' in content_type:
             return content.decode('utf-8'), content_type
         elif 'image/' in content_type:
@@ -106,17 +144,15 @@ class Chat():
             print(f"Unavailable content type: {content_type}")
             return None, None
 
-    # Write chat to a file
-    def write_output(self, user_input, model_output):
-        with open(OUTPUT_HISTORY, 'a', encoding='utf-8') as file:
-            file.write('--- (user)\n')
-            file.write(f"{user_input}\n")
-            file.write('\n')
-            file.write(f"--- ({self.MODEL})\n")
-            file.write(f"{model_output}\n")
-            file.write('\n')
+    # Record chat in the history store
+    @profiler.staged('log')
+    def write_output(self, user_input, model_output, usage=None, source=None):
+        model = self.MODEL if self.last_model is None else self.last_model
+        history_store.get_store().add(
+                model, source, user_input, model_output, usage)
 
     # Write a request debug log
+    @profiler.staged('log')
     def write_request_debug_log(self, headers, data, response):
         with open(REQUEST_DEBUG_LOG, 'w', encoding='utf-8') as file:
             file.write('--- (request) ---\n')
@@ -132,8 +168,49 @@ class Chat():
                 + f"{json.dumps(response.json(), ensure_ascii=False, indent=2)}\n")
             file.write('\n')
 
+    # Send the next chunk in the background while the user reads. Each
+    # prefetch runs on its own daemon thread, so a discarded one never
+    # delays the next prefetch or the exit.
+    def _prefetch(self, message):
+        history = deque()
+        future = submit_daemon(self._send, message, history, False, False)
+        return message, future, history
+
+    # The request cannot be aborted once sent; its result is dropped
+    def _cancel_prefetch(self, pending):
+        if pending is not None:
+            pending[1].cancel()
+        return None
+
+    # (source, position, length) of the earlier chunks that the chunks
+    # at the head of buf repeat. A match that overlaps the chunk's own
+    # range in the same source, e.g. after going back with .goto, is the
+    # chunk itself rather than a duplicate and ends the run.
+    def _duplicate_chunks(self, buf, chunk_size, prmt, source, processed):
+        duplicates = []
+        index = self.chunk_indexes.get(prmt)
+        if self.dedup is False or index is None:
+            return duplicates
+        pos = 0
+        while pos < len(buf):
+            chunk = buf[pos:pos + chunk_size]
+            label = index.find(chunk)
+            if label is None:
+                break
+            first_source, first_pos, first_len = label
+            start = processed + pos
+            if first_source == source and first_pos < start + len(chunk) \
+                    and start < first_pos + first_len:
+                break
+            duplicates.append(label)
+            pos += chunk_size
+        return duplicates
+
     # Processing Functions
-    def talk(self, text, read_all=False, url=None):
+    def talk(self, text, read_all=False, url=None, source=None):
+
+        if source is None:
+            source = url
 
         buf = text
         if read_all is True:
@@ -153,6 +230,9 @@ class Chat():
 
         user_input = ''
 
+        prefetch = self.prefetch is True and read_all is False
+        pending = None
+
         while True:
 
             if user_input != '':
@@ -184,6 +264,9 @@ class Chat():
                 print(f"Model: {self.MODEL}")
                 print(f"Chunk size: {chunk_size}")
                 print(f"Default prompt: {prmt}")
+                print(f"Prefetch: {prefetch}")
+                print(f"Skip duplicate chunks: {self.dedup}")
+                print(f"Requests saved: {self.saved_requests}")
                 print(f"System prompt: {SYSTEM_PROMPT}")
                 print(f"History size: {len(conversation)}")
                 print(f"Reading URL: {url}")
@@ -201,6 +284,7 @@ class Chat():
                 buf = text
                 print("Going to the first.")
                 processed = 0
+                pending = self._cancel_prefetch(pending)
                 continue
             pattern = r'^\.(goto|g) (\d+)$'
             match = re.search(pattern, user_input)
@@ -211,6 +295,7 @@ class Chat():
                 buf = text[pos:]
                 print(f"Going to {pos}")
                 processed = pos
+                pending = self._cancel_prefetch(pending)
                 continue
             pattern = r'^\.(chunk|c)(=|\s)(\d+)$'
             match = re.search(pattern, user_input)
@@ -219,6 +304,7 @@ class Chat():
                 if chunk_size < 1:
                     chunk_size = 1
                 print(f"chunk_size has been set to {chunk_size}")
+                pending = self._cancel_prefetch(pending)
                 continue
             pattern = r'^\.(prompt|p)(=|\s)(.+)$'
             match = re.search(pattern, user_input, re.DOTALL)
@@ -228,6 +314,20 @@ class Chat():
                     print(f"PREVIOUS default prompt: {prmt}")
                     print(f"NEW default prompt: {new_prompt}")
                     prmt = new_prompt
+                    pending = self._cancel_prefetch(pending)
+                continue
+            pattern = r'^\.(find|f)(=|\s)(.+)$'
+            match = re.search(pattern, user_input, re.DOTALL)
+            if match:
+                history_store.print_matches(
+                        history_store.get_store().find(match.group(3)))
+                continue
+            pattern = r'^\.dedup(=|\s)(on|off)$'
+            match = re.search(pattern, user_input)
+            if match:
+                self.dedup = match.group(2) == 'on'
+                print(f"Skip duplicate chunks: {self.dedup}")
+                pending = self._cancel_prefetch(pending)
                 continue
             if user_input in ['.o', '.open']:
                 if url is None:
@@ -237,18 +337,53 @@ class Chat():
                 continue
 
             if user_input == '':
+                with profiler.stage('chunk'):
+                    duplicates = self._duplicate_chunks(
+                            buf, chunk_size, prmt, source, processed)
+                for first_source, first_pos, _ in duplicates:
+                    print(f"(Skipped a duplicate chunk at {processed:,}, "
+                          + f"same as {first_source or 'text'} "
+                          + f"at {first_pos:,}.)")
+                    buf = buf[chunk_size:]
+                    processed = min(processed + chunk_size, len(text))
+                    self.saved_requests += 1
                 if len(buf) > 0:
-                    chunk = buf[:chunk_size]
-                    message = chunk
-                    if prmt is not None:
-                        message += "\n\n" + prmt
-                    response, usage = self._send(message, conversation, False)
-                    self.write_output(message, response)
+                    with profiler.stage('chunk'):
+                        chunk = buf[:chunk_size]
+                        message = chunk
+                        if prmt is not None:
+                            message += "\n\n" + prmt
+                    response = None
+                    if pending is not None and pending[0] == message:
+                        _, future, history = pending
+                        response, usage = future.result()
+                        if response is not None:
+                            print(f"({self.MODEL}): ", end="")
+                            print(response, end="")
+                            conversation.extend(history)
+                    pending = None
+                    if response is None:
+                        response, usage = self._send(
+                            message, conversation, False)
+                    self.write_output(message, response, usage, source)
                     if response is not None:
+                        with profiler.stage('chunk'):
+                            self.chunk_indexes.setdefault(
+                                    prmt, dedup.ChunkIndex()).add(
+                                            chunk,
+                                            (source, processed, len(chunk)))
                         buf = buf[len(chunk):]
                         processed += chunk_size
                         if processed >= len(text):
                             processed = len(text)
+                        if prefetch is True:
+                            skip = chunk_size * len(self._duplicate_chunks(
+                                    buf, chunk_size, prmt, source, processed))
+                            if len(buf) > skip:
+                                next_message = buf[skip:skip + chunk_size]
+                                if prmt is not None:
+                                    next_message += "\n\n" + prmt
+                                pending = self._prefetch(next_message)
                     empty_count = 0
                 elif empty_count >= 1:
                     break
@@ -258,15 +393,17 @@ class Chat():
                     continue
             else:
                 response, usage = self._send(user_input, conversation, True)
-                self.write_output(user_input, response)
+                self.write_output(user_input, response, usage, source)
             print()
 
+        self._cancel_prefetch(pending)
+
     def process_pdf(self, file_name, read_all):
         with open(file_name, "rb") as fh:
             text = self.read_pdf(BytesIO(fh.read()))
 
         if text != '':
-            self.talk(text, read_all)
+            self.talk(text, read_all, source=file_name)
         else:
             print("Empty PDF.")
 
@@ -274,7 +411,129 @@ class Chat():
         with open(file_name, 'r', encoding='utf-8') as file:
             text = file.read()
             if text != '':
-                self.talk(text, read_all)
+                self.talk(text, read_all, source=file_name)
+
+    # Read a URL or a file as text without starting a conversation
+    def load_text(self, source):
+        if source.startswith("http"):
+            text, content_type = self.fetch_url_content(source)
+            if text is None or 'image/' in content_type:
+                return None
+            return text
+
+        if not os.path.exists(source):
+            return None
+
+        kind = filetype.guess(source)
+        if kind and kind.extension == 'pdf':
+            with open(source, "rb") as fh:
+                return self.read_pdf(BytesIO(fh.read()))
+        elif kind and 'image/' in kind.mime:
+            return None
+        with open(source, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def process_batch(self, sources, read_all):
+        chunks = []
+        messages = []
+        index = dedup.ChunkIndex()
+        for source in sources:
+            text = self.load_text(source)
+            if text is None or text == '':
+                print(f"Failed to read: {source}")
+                continue
+            if read_all is True:
+                chunk_size = len(text)
+            else:
+                chunk_size = DEFAULT_CHUNK_SIZE
+            with profiler.stage('chunk'):
+                for pos in range(0, len(text), chunk_size):
+                    chunk = text[pos:pos + chunk_size]
+                    original = None
+                    if self.dedup is True:
+                        original = index.find(chunk)
+                    if original is None:
+                        original = len(messages)
+                        message = chunk
+                        if DEFAULT_PROMPT is not None:
+                            message += "\n\n" + DEFAULT_PROMPT
+                        messages.append((source, pos, message))
+                        index.add(chunk, original)
+                    else:
+                        self.saved_requests += 1
+                    chunks.append((source, pos, original))
+
+        if len(chunks) == 0:
+            print("Nothing to process.")
+            return False
+
+        print(f"Submitting {len(messages)} chunks as a batch job.")
+        if self.saved_requests > 0:
+            print(f"Requests saved: {self.saved_requests}")
+        results = self._send_batch([message for _, _, message in messages])
+        if results is None:
+            return False
+
+        for source, pos, original in chunks:
+            print(f"--- {source} ({pos:,})")
+            first_source, first_pos, message = messages[original]
+            if (first_source, first_pos) != (source, pos):
+                print(f"(Duplicate of {first_source} ({first_pos:,}).)")
+                print()
+                continue
+            response, usage = results[original]
+            if response is None:
+                print("Failed to get a response.")
+            else:
+                print(f"({self.MODEL}): {response}")
+            if usage is not None:
+                print(f"\n{usage}")
+            print()
+            self.write_output(message, response, usage, source)
+
+        return True
+
+    # Non-interactive counterpart of read_and_process: every chunk is
+    # sent with prmt and the responses are returned instead of printed
+    def process_source(self, source, read_all, prmt):
+        if source.startswith("http"):
+            text, content_type = self.fetch_url_content(source)
+            if text is None:
+                return None
+        elif os.path.exists(source):
+            kind = filetype.guess(source)
+            if kind and 'image/' in kind.mime:
+                text, content_type = self.encode_image(source), kind.mime
+            else:
+                text, content_type = self.load_text(source), None
+        else:
+            response, usage = self._send(source, None, False, False)
+            self.write_output(source, response, usage)
+            return [{'pos': 0, 'response': response, 'usage': usage}]
+
+        if content_type is not None and 'image/' in content_type:
+            response, usage = self._send_image(
+                prmt, content_type, text, False)
+            self.write_output(prmt, response, usage, source)
+            return [{'pos': 0, 'response': response, 'usage': usage}]
+
+        if text is None or text == '':
+            return None
+
+        if read_all is True:
+            chunk_size = len(text)
+        else:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        results = []
+        for pos in range(0, len(text), chunk_size):
+            message = text[pos:pos + chunk_size]
+            if prmt is not None:
+                message += "\n\n" + prmt
+            response, usage = self._send(message, None, False, False)
+            self.write_output(message, response, usage, source)
+            results.append({'pos': pos, 'response': response, 'usage': usage})
+        return results
 
     def read_and_process(self, source, read_all):
         if source.startswith("http"):
@@ -291,7 +550,7 @@ class Chat():
             else:
                 response, usage = self._send_image(
                     DEFAULT_PROMPT, content_type, text)
-                self.write_output(DEFAULT_PROMPT, response)
+                self.write_output(DEFAULT_PROMPT, response, usage, source)
                 if usage is not None:
                     print(f"\n{usage}", end="")
                 print("")
@@ -306,7 +565,7 @@ class Chat():
                 base64_image = self.encode_image(source)
                 response, usage = self._send_image(
                     DEFAULT_PROMPT, kind.mime, base64_image)
-                self.write_output(DEFAULT_PROMPT, response)
+                self.write_output(DEFAULT_PROMPT, response, usage, source)
                 if usage is not None:
                     print(f"\n{usage}", end="")
                 print("")
@@ -314,7 +573,7 @@ class Chat():
                 self.process_text(source, read_all)
         else:
             response, usage = self._send(source, None, False)
-            self.write_output(source, response)
+            self.write_output(source, response, usage)
             print()
 
         return True
@@ -345,13 +604,53 @@ class Chat():
                                  + "external data. This is effective "
                                  + "when processing and loading "
                                  + "external data.")
+        parser.add_argument('-b',
+                            '--batch',
+                            nargs='+',
+                            metavar='SOURCE',
+                            help="Process every chunk of the given URLs "
+                                 + "or files with the default prompt "
+                                 + "as a single offline batch job.")
+        parser.add_argument('--profile',
+                            action='store_true',
+                            help="Collect cProfile and tracemalloc data "
+                                 + "for the session and write a report "
+                                 + "with per-stage timings at exit.")
+        parser.add_argument('--profile-output',
+                            default=PROFILE_REPORT,
+                            metavar='REPORT',
+                            help="Path of the profile report.")
+        parser.add_argument('--prefetch',
+                            action='store_true',
+                            help="Send the next chunk in the background "
+                                 + "while the current response is being "
+                                 + "read.")
         args = parser.parse_args()
 
+        if args.prefetch is True:
+            self.prefetch = True
+
         if args.prompt is not None:
             global DEFAULT_PROMPT
             DEFAULT_PROMPT = args.prompt
 
-        if args.source is None:
-            self.talk("")
-        else:
-            self.read_and_process(args.source, args.all)
+        notice = history_store.legacy_history_notice()
+        if notice is not None:
+            print(notice)
+
+        if args.profile is True:
+            profiler.enable()
+            for name in ['_send', '_send_image', '_send_batch']:
+                setattr(self, name,
+                        profiler.staged('send')(getattr(self, name)))
+
+        try:
+            if args.batch is not None:
+                self.process_batch(args.batch, args.all)
+            elif args.source is None:
+                self.talk("")
+            else:
+                self.read_and_process(args.source, args.all)
+        finally:
+            if args.profile is True:
+                profiler.report(args.profile_output)
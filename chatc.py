@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Thin client for daemon.py. It only uses the standard library so that
+# starting it stays cheap; the real work happens in the daemon.
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+DAEMON_SOCKET = os.getenv(
+        "CHAT_DAEMON_SOCKET",
+        f"{os.path.expanduser('~')}/.chat_daemon.sock")
+BACKENDS = ['gpt', 'gemini', 'router']
+
+
+def request(path, data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(data).encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
+
+
+# Handle the request in this process when the daemon is not available,
+# taking the same non-interactive path as the daemon
+def fallback(data):
+    import daemon
+    try:
+        return daemon.handle_request(data)
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+# CLI Interface
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Send a source to the running chat daemon.")
+
+    parser.add_argument('source',
+                        help="Specify the source for the prompt. "
+                             + "Can be a URL, a file path, "
+                             + "or a direct prompt text.")
+    parser.add_argument('-m',
+                        '--backend',
+                        choices=BACKENDS,
+                        default=os.getenv("CHAT_BACKEND", "gpt"),
+                        help="Backend that handles the request.")
+    parser.add_argument('-a',
+                        '--all',
+                        action='store_true',
+                        help="Send the entire text as a single chunk.")
+    parser.add_argument('-p',
+                        '--prompt',
+                        help="Override the default prompt applied to "
+                             + "external data.")
+    parser.add_argument('-s',
+                        '--socket',
+                        default=DAEMON_SOCKET,
+                        help="Path of the daemon's Unix socket.")
+    args = parser.parse_args()
+
+    data = {
+        'backend': args.backend,
+        'source': os.path.abspath(args.source)
+        if os.path.exists(args.source) else args.source,
+        'all': args.all,
+    }
+    if args.prompt is not None:
+        data['prompt'] = args.prompt
+
+    try:
+        reply = request(args.socket, data)
+    except (FileNotFoundError, ConnectionRefusedError):
+        reply = fallback(data)
+
+    if reply['ok'] is not True:
+        print(reply['error'], file=sys.stderr)
+        sys.exit(1)
+
+    results = reply['results']
+    for result in results:
+        if len(results) > 1:
+            print(f"--- ({result['pos']:,})")
+        if result['response'] is None:
+            print("Failed to get a response.", file=sys.stderr)
+        else:
+            print(result['response'])
+    if any(result['response'] is None for result in results):
+        sys.exit(1)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import argparse
+import chat
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+# Constants
+DAEMON_SOCKET = os.getenv(
+        "CHAT_DAEMON_SOCKET",
+        f"{os.path.expanduser('~')}/.chat_daemon.sock")
+BACKENDS = ['gpt', 'gemini', 'router']
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+# Backends are created on first use and then kept warm, together with
+# their HTTP connection pools, for the lifetime of the daemon.
+def get_backend(name):
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'gpt':
+                import gpt
+                _backends[name] = gpt.GPT(gpt.MODEL)
+            elif name == 'gemini':
+                import gemini
+                _backends[name] = gemini.Gemini(gemini.MODEL)
+            elif name == 'router':
+                import router
+                _backends[name] = router.Router(f"router:{router.PRIMARY}")
+            else:
+                raise ValueError(f"Unknown backend: {name}")
+        return _backends[name]
+
+
+def handle_request(request):
+    backend = get_backend(request.get('backend', 'gpt'))
+    results = backend.process_source(request['source'],
+                                      request.get('all', False),
+                                      request.get('prompt',
+                                                  chat.DEFAULT_PROMPT))
+    if results is None:
+        return {'ok': False, 'error': "Failed to read."}
+    return {'ok': True, 'model': backend.MODEL, 'results': results}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        # A liveness check connects and closes without sending anything
+        if line == b'':
+            return
+        try:
+            reply = handle_request(json.loads(line))
+        except Exception as e:
+            reply = {'ok': False, 'error': str(e)}
+        try:
+            self.wfile.write(
+                json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n')
+        except BrokenPipeError:
+            pass
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+# CLI Interface
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve gpt/gemini requests from warm backends "
+                    + "over a local Unix socket.")
+    parser.add_argument('-s',
+                        '--socket',
+                        default=DAEMON_SOCKET,
+                        help="Path of the Unix socket.")
+    parser.add_argument('-w',
+                        '--warm',
+                        nargs='*',
+                        default=['gpt', 'gemini'],
+                        choices=BACKENDS,
+                        help="Backends to create at startup.")
+    args = parser.parse_args()
+
+    # Only remove a socket that no daemon is listening on any more
+    if os.path.exists(args.socket):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(args.socket)
+            except ConnectionRefusedError:
+                os.remove(args.socket)
+            else:
+                print(f"A daemon is already listening on {args.socket}")
+                sys.exit(1)
+
+    for name in args.warm:
+        get_backend(name)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = Server(args.socket, RequestHandler)
+    os.chmod(args.socket, 0o600)
+    print(f"Listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
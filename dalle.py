@@ -1,20 +1,30 @@
 #!/usr/bin/env python3
 
 import argparse
+import base64
 import json
 import os
 import requests
+import threading
+import time
 import webbrowser
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Read .env
 load_dotenv()
 
 # Constants
-API_URL = 'https://api.openai.com/v1/images/generations'
+API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+API_URL = API_BASE + '/images/generations'
 MODEL = os.getenv("IMAGE_MODEL", "dall-e-3")
 IMAGE_SIZE = "1024x1024"
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", 4))
+IMAGE_RATE_LIMIT = int(os.getenv("IMAGE_RATE_LIMIT", 5))  # per minute
+MANIFEST = "manifest.jsonl"
 
 # OpenAI
 API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -54,13 +64,153 @@ def _send(message):
         print(e)
 
 
+# Spaces out requests so that at most `per_minute` start in any minute
+class RateLimiter():
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute if per_minute > 0 else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _generate(session, limiter, run_id, index, message, output_dir):
+
+    entry = {
+        'run': run_id,
+        'index': index,
+        'prompt': message,
+    }
+    start = time.monotonic()
+
+    try:
+        limiter.wait()
+        entry['wait_sec'] = round(time.monotonic() - start, 3)
+
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {API_KEY}',
+        }
+
+        data = {
+            'model': MODEL,
+            'prompt': message,
+            'size': IMAGE_SIZE,
+            'response_format': 'b64_json',
+        }
+
+        request_start = time.monotonic()
+        response = session.post(API_URL,
+                                headers=headers,
+                                data=json.dumps(data))
+        response.raise_for_status()
+        entry['request_sec'] = round(time.monotonic() - request_start, 3)
+
+        result = response.json()['data'][0]
+        entry['revised_prompt'] = result.get('revised_prompt')
+
+        if result.get('b64_json') is not None:
+            image = base64.b64decode(result['b64_json'])
+        else:
+            download_start = time.monotonic()
+            entry['url'] = result['url']
+            response = session.get(result['url'])
+            response.raise_for_status()
+            image = response.content
+            entry['download_sec'] = \
+                round(time.monotonic() - download_start, 3)
+
+        file_name = os.path.join(output_dir, f"{run_id}-{index:04d}.png")
+        with open(file_name, 'wb') as file:
+            file.write(image)
+        entry['file'] = file_name
+
+    except Exception as e:
+        entry['error'] = str(e)
+
+    entry['total_sec'] = round(time.monotonic() - start, 3)
+    return entry
+
+
+def generate_all(prompts, output_dir, concurrency, rate_limit):
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    session = requests.Session()
+    # One pool for the API host and one for the image download host
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    limiter = RateLimiter(rate_limit)
+    # Files of earlier runs in the same directory are kept, and the
+    # manifest keeps growing, so every run gets its own file prefix
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            open(os.path.join(output_dir, MANIFEST), 'a',
+                 encoding='utf-8') as manifest:
+        futures = [executor.submit(_generate, session, limiter, run_id,
+                                   index, message, output_dir)
+                   for index, message in enumerate(prompts)]
+        for future in as_completed(futures):
+            entry = future.result()
+            if 'error' in entry:
+                print(f"[{entry['index']}] {entry['error']}")
+            else:
+                print(f"[{entry['index']}] {entry['file']} "
+                      + f"({entry['total_sec']}s)")
+            manifest.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            manifest.flush()
+
+
 # CLI Interface
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Image generation utility.")
 
     parser.add_argument('prompt',
-                        help="Specify prompt for the image generation.")
+                        nargs='*',
+                        help="Specify prompts for the image generation.")
+    parser.add_argument('-f',
+                        '--file',
+                        help="Read additional prompts from a file, "
+                             + "one prompt per line.")
+    parser.add_argument('-o',
+                        '--output-dir',
+                        help="Write the images and a JSONL manifest to "
+                             + "this directory instead of opening them "
+                             + "in a web browser.")
+    parser.add_argument('-j',
+                        '--concurrency',
+                        type=int,
+                        default=IMAGE_CONCURRENCY,
+                        help="Number of images generated at the same time.")
+    parser.add_argument('-r',
+                        '--rate-limit',
+                        type=int,
+                        default=IMAGE_RATE_LIMIT,
+                        help="Maximum number of requests per minute.")
     args = parser.parse_args()
 
-    _send(args.prompt)
+    prompts = list(args.prompt)
+    if args.file is not None:
+        with open(args.file, 'r', encoding='utf-8') as file:
+            prompts += [line.strip() for line in file if line.strip() != '']
+
+    if len(prompts) == 0:
+        print('Prompt is not specified.')
+    elif len(prompts) == 1 and args.output_dir is None:
+        _send(prompts[0])
+    else:
+        generate_all(prompts,
+                     args.output_dir or "images",
+                     max(args.concurrency, 1),
+                     args.rate_limit)
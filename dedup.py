@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SHINGLE_SIZE = 3
+# Must stay below SIMHASH_BANDS so that a near duplicate always shares
+# at least one band with the original.
+SIMHASH_DISTANCE = int(os.getenv("DUPLICATE_SIMHASH_DISTANCE", 3))
+
+
+def normalize(text):
+    return ' '.join(text.split()).lower()
+
+
+def _hash64(text):
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def simhash(text):
+    words = normalize(text).split()
+    shingles = [' '.join(words[i:i + SHINGLE_SIZE])
+                for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            if h >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def _bands(fingerprint):
+    width = SIMHASH_BITS // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    return [(band, fingerprint >> (band * width) & mask)
+            for band in range(SIMHASH_BANDS)]
+
+
+# Remembers chunks by an exact hash of the normalized text and by a
+# SimHash, so that repeated and nearly repeated chunks can be found.
+class ChunkIndex():
+
+    def __init__(self, max_distance=SIMHASH_DISTANCE):
+        self.max_distance = min(max_distance, SIMHASH_BANDS - 1)
+        self.exact = {}
+        self.bands = {}
+
+    def find(self, text):
+        normalized = normalize(text)
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        if digest in self.exact:
+            return self.exact[digest]
+
+        if self.max_distance < 0:
+            return None
+        fingerprint = simhash(normalized)
+        for band in _bands(fingerprint):
+            for other, label in self.bands.get(band, []):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    return label
+        return None
+
+    def add(self, text, label):
+        normalized = normalize(text)
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        self.exact.setdefault(digest, label)
+
+        fingerprint = simhash(normalized)
+        for band in _bands(fingerprint):
+            self.bands.setdefault(band, []).append((fingerprint, label))
@@ -3,18 +3,21 @@
 import chat
 import json
 import os
-import requests
+import time
 
 MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro-latest")
 API_KEY = os.getenv("GEMINI_API_KEY", "")
-API_URL = "https://generativelanguage.googleapis.com/v1beta/models/" \
-           + MODEL + ":generateContent?key=" + API_KEY
+API_BASE = os.getenv("GEMINI_API_BASE",
+                     "https://generativelanguage.googleapis.com/v1beta")
+API_URL = API_BASE + "/models/" + MODEL + ":generateContent?key=" + API_KEY
+BATCH_URL = API_BASE + "/models/" + MODEL \
+           + ":batchGenerateContent?key=" + API_KEY
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", None)
 
 
 class Gemini(chat.Chat):
 
-    def _send(self, message, conversation, use_history):
+    def _send(self, message, conversation, use_history, verbose=True):
 
         if conversation is None:
             messages = []
@@ -43,9 +46,10 @@ class Gemini(chat.Chat):
                     }]
                 }
 
-            response = requests.post(API_URL,
-                                     headers=headers,
-                                     data=json.dumps(data))
+            response = self.session.post(API_URL,
+                                         headers=headers,
+                                         data=json.dumps(data),
+                                         timeout=chat.REQUEST_TIMEOUT_SEC)
 
             self.write_request_debug_log(headers, data, response)
 
@@ -64,9 +68,9 @@ class Gemini(chat.Chat):
                      + f"Reason: {result['candidates'][0]['finishReason']}"
                 model_message = {"role": "model", "parts": [{"text": content}]}
 
-            print(f"({MODEL}): ", end="")
-
-            print(content, end="")
+            if verbose is True:
+                print(f"({MODEL}): ", end="")
+                print(content, end="")
 
             usage = result['usageMetadata']
 
@@ -75,11 +79,13 @@ class Gemini(chat.Chat):
                 conversation.append(model_message)
 
         except Exception as e:
-            print(e)
+            if verbose is True:
+                print(e)
             return None, None
         return content, usage
 
-    def _send_image(self, message, mime_type, base64_image):
+    def _send_image(self, message, mime_type, base64_image,
+                    verbose=True):
 
         messages = []
 
@@ -108,9 +114,10 @@ class Gemini(chat.Chat):
 
             content = ''
 
-            response = requests.post(API_URL,
-                                     headers=headers,
-                                     data=json.dumps(data))
+            response = self.session.post(API_URL,
+                                         headers=headers,
+                                         data=json.dumps(data),
+                                         timeout=chat.REQUEST_TIMEOUT_SEC)
 
             self.write_request_debug_log(headers, data, response)
 
@@ -126,15 +133,104 @@ class Gemini(chat.Chat):
                 content = "ERROR: Failed to get the content in the respont. " \
                     + f"Reason: {result['candidates'][0]['finishReason']}"
 
-            print(f"({MODEL}): ", end="")
-
-            print(content, end="")
+            if verbose is True:
+                print(f"({MODEL}): ", end="")
+                print(content, end="")
 
         except Exception as e:
-            print(e)
+            if verbose is True:
+                print(e)
             return None, None
         return content, None
 
+    def _send_batch(self, messages):
+
+        batch_requests = []
+        for i, message in enumerate(messages):
+            request = {
+                'contents': [
+                    {"role": "user", "parts": [{"text": message.strip()}]}
+                ]
+            }
+            if SYSTEM_PROMPT is not None:
+                request['system_instruction'] = {
+                    'parts': [{
+                        'text': SYSTEM_PROMPT
+                    }]
+                }
+            batch_requests.append({
+                'request': request,
+                'metadata': {'key': f"chunk-{i}"},
+            })
+
+        results = [(None, None)] * len(messages)
+
+        try:
+            headers = {
+                'Content-Type': 'application/json',
+            }
+
+            data = {
+                'batch': {
+                    'display_name': 'chat-batch',
+                    'input_config': {
+                        'requests': {
+                            'requests': batch_requests
+                        }
+                    }
+                }
+            }
+
+            response = self.session.post(BATCH_URL,
+                                         headers=headers,
+                                         data=json.dumps(data))
+
+            self.write_request_debug_log(headers, data, response)
+
+            response.raise_for_status()
+
+            operation = response.json()
+
+            while operation.get('done') is not True:
+                state = operation.get('metadata', {}).get('state')
+                print(f"Batch {operation['name']}: {state}")
+                time.sleep(chat.BATCH_POLL_INTERVAL_SEC)
+                response = self.session.get(
+                        API_BASE + f"/{operation['name']}?key={API_KEY}",
+                        headers=headers)
+                response.raise_for_status()
+                operation = response.json()
+
+            if 'error' in operation:
+                print(f"Batch {operation['name']}: {operation['error']}")
+                return None
+
+            print(f"Batch {operation['name']}: done")
+
+            inlined = operation['response']['inlinedResponses']
+            for i, output in enumerate(inlined['inlinedResponses']):
+                index = i
+                if 'metadata' in output:
+                    index = int(output['metadata']['key'].split('-')[1])
+                if 'response' not in output:
+                    print(f"chunk {index}: {output.get('error')}")
+                    continue
+                result = output['response']
+                if 'content' in result['candidates'][0]:
+                    content = \
+                        result['candidates'][0]['content']['parts'][0]['text']
+                    content = content.rstrip(" \n")
+                else:
+                    content = "ERROR: Failed to get contents in the " \
+                        + "response. Reason: " \
+                        + f"{result['candidates'][0]['finishReason']}"
+                results[index] = (content, result.get('usageMetadata'))
+
+        except Exception as e:
+            print(e)
+            return None
+        return results
+
 
 # CLI Interface
 if __name__ == "__main__":
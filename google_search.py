@@ -1,6 +1,8 @@
 import argparse
+import json
 import os
 import requests
+import time
 import urllib.parse
 
 from dotenv import load_dotenv
@@ -21,6 +23,11 @@ load_dotenv()
 USER_AGENT = os.getenv("USER_AGENT", None)
 API_KEY = os.getenv("GOOGLE_API_KEY", None)
 CSE_ID = os.getenv("GOOGLE_CSE_ID", None)
+SEARCH_CACHE = os.getenv(
+        "SEARCH_CACHE",
+        f"{os.path.expanduser('~')}/.google_search_cache")
+SEARCH_CACHE_TTL_SEC = int(os.getenv("SEARCH_CACHE_TTL", 86400))
+SEARCH_DAILY_QUOTA = int(os.getenv("SEARCH_DAILY_QUOTA", 100))
 HELPER_CLASS = os.getenv("SEARCH_HELPER", "gemini")
 if HELPER_CLASS == "gemini":
     import gemini
@@ -71,6 +78,39 @@ def select_list(title, explanation, items, default):
     ).run()
 
 
+def load_cache():
+    try:
+        with open(SEARCH_CACHE, 'r', encoding='utf-8') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+    cache.setdefault('pages', {})
+    cache.setdefault('quota', {'date': '', 'count': 0})
+    return cache
+
+
+def save_cache(cache):
+    now = time.time()
+    cache['pages'] = {key: page for key, page in cache['pages'].items()
+                      if now - page['time'] < SEARCH_CACHE_TTL_SEC}
+    with open(SEARCH_CACHE, 'w', encoding='utf-8') as file:
+        json.dump(cache, file, ensure_ascii=False)
+
+
+# Count a Custom Search API call against today's quota
+def count_query(cache):
+    today = time.strftime('%Y-%m-%d')
+    if cache['quota']['date'] != today:
+        cache['quota'] = {'date': today, 'count': 0}
+    cache['quota']['count'] += 1
+
+
+def queries_today(cache):
+    if cache['quota']['date'] != time.strftime('%Y-%m-%d'):
+        return 0
+    return cache['quota']['count']
+
+
 def search(search_term):
 
     print("Query: " + search_term)
@@ -86,20 +126,43 @@ def search(search_term):
     if USER_AGENT is not None:
         headers['User-Agent'] = USER_AGENT
 
-    startIndex = 0
+    # The API numbers results from 1, as do its previousPage links
+    startIndex = 1
 
-    while True:
+    cache = load_cache()
 
-        url = base_url + f"&start={startIndex}"
-        response = requests.get(url, headers=headers)
+    while True:
 
-        search_results = {}
-        if response.status_code == 200:
-            response.encoding = 'utf-8'
-            search_results = response.json()
+        key = f"{search_term}\n{startIndex}"
+        page = cache['pages'].get(key)
+        if page is not None \
+                and time.time() - page['time'] < SEARCH_CACHE_TTL_SEC:
+            search_results = page['results']
+            source = 'cached'
         else:
-            print(f"Failed to retrieve the web page: {response.status_code}")
-            return False
+            url = base_url + f"&start={startIndex}"
+            response = requests.get(url, headers=headers)
+            count_query(cache)
+
+            search_results = {}
+            if response.status_code == 200:
+                response.encoding = 'utf-8'
+                search_results = response.json()
+                cache['pages'][key] = {
+                    'time': time.time(),
+                    'results': search_results,
+                }
+                save_cache(cache)
+            else:
+                save_cache(cache)
+                print("Failed to retrieve the web page: "
+                      + f"{response.status_code}")
+                return False
+            source = 'API'
+
+        quota = f"Quota: {queries_today(cache)}/{SEARCH_DAILY_QUOTA} " \
+            + f"queries today ({source})"
+        print(quota)
 
         if 'items' not in search_results:
             print("No results.")
@@ -129,7 +192,8 @@ def search(search_term):
 
             result = select_list(
                     'Search Results',
-                    'Please select one search result from the following:',
+                    'Please select one search result from the following:'
+                    + f"\n{quota}",
                     links, result)
 
             if result is None:
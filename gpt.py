@@ -3,17 +3,18 @@
 import chat
 import json
 import os
-import requests
+import time
 
 API_KEY = os.getenv("OPENAI_API_KEY", "")
-API_URL = 'https://api.openai.com/v1/chat/completions'
+API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+API_URL = API_BASE + '/chat/completions'
 MODEL = os.getenv("GPT_MODEL", "gpt-4o")
 SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", None)
 
 
 class GPT(chat.Chat):
 
-    def _send(self, message, conversation, use_history):
+    def _send(self, message, conversation, use_history, verbose=True):
 
         if conversation is None:
             messages = []
@@ -43,9 +44,10 @@ class GPT(chat.Chat):
 
             content = ''
 
-            response = requests.post(API_URL,
-                                     headers=headers,
-                                     data=json.dumps(data))
+            response = self.session.post(API_URL,
+                                         headers=headers,
+                                         data=json.dumps(data),
+                                         timeout=chat.REQUEST_TIMEOUT_SEC)
 
             self.write_request_debug_log(headers, data, response)
 
@@ -53,10 +55,11 @@ class GPT(chat.Chat):
 
             result = response.json()
 
-            print(f"({MODEL}): ", end="")
-
             content = result['choices'][0]['message']['content']
-            print(content, end="")
+
+            if verbose is True:
+                print(f"({MODEL}): ", end="")
+                print(content, end="")
 
             usage = result['usage']
 
@@ -66,11 +69,13 @@ class GPT(chat.Chat):
                 conversation.append(model_message)
 
         except Exception as e:
-            print(e)
+            if verbose is True:
+                print(e)
             return None, None
         return content, usage
 
-    def _send_image(self, message, mime_type, base64_image):
+    def _send_image(self, message, mime_type, base64_image,
+                    verbose=True):
 
         messages = []
 
@@ -108,9 +113,10 @@ class GPT(chat.Chat):
 
             content = ''
 
-            response = requests.post(API_URL,
-                                     headers=headers,
-                                     data=json.dumps(data))
+            response = self.session.post(API_URL,
+                                         headers=headers,
+                                         data=json.dumps(data),
+                                         timeout=chat.REQUEST_TIMEOUT_SEC)
 
             self.write_request_debug_log(headers, data, response)
 
@@ -118,18 +124,124 @@ class GPT(chat.Chat):
 
             result = response.json()
 
-            print(f"({MODEL}): ", end="")
-
             content = result['choices'][0]['message']['content']
-            print(content, end="")
+
+            if verbose is True:
+                print(f"({MODEL}): ", end="")
+                print(content, end="")
 
             usage = result['usage']
 
         except Exception as e:
-            print(e)
+            if verbose is True:
+                print(e)
             return None, None
         return content, usage
 
+    def _send_batch(self, messages):
+
+        lines = []
+        for i, message in enumerate(messages):
+            batch_messages = []
+            if SYSTEM_PROMPT is not None:
+                batch_messages.append(
+                    {"role": "system", "content": SYSTEM_PROMPT})
+            batch_messages.append(
+                {"role": "user", "content": message.strip()})
+            lines.append(json.dumps({
+                'custom_id': f"chunk-{i}",
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': MODEL,
+                    'messages': batch_messages,
+                },
+            }, ensure_ascii=False))
+
+        results = [(None, None)] * len(messages)
+
+        try:
+            headers = {
+                'Authorization': f'Bearer {API_KEY}',
+            }
+
+            response = self.session.post(
+                    API_BASE + '/files',
+                    headers=headers,
+                    data={'purpose': 'batch'},
+                    files={'file': ('batch.jsonl',
+                                    '\n'.join(lines).encode('utf-8'))})
+            response.raise_for_status()
+            input_file_id = response.json()['id']
+
+            headers['Content-Type'] = 'application/json'
+
+            data = {
+                'input_file_id': input_file_id,
+                'endpoint': '/v1/chat/completions',
+                'completion_window': '24h',
+            }
+
+            response = self.session.post(API_BASE + '/batches',
+                                         headers=headers,
+                                         data=json.dumps(data))
+
+            self.write_request_debug_log(headers, data, response)
+
+            response.raise_for_status()
+
+            batch = response.json()
+
+            while batch['status'] not in ['completed', 'failed',
+                                          'expired', 'cancelled']:
+                print(f"Batch {batch['id']}: {batch['status']} "
+                      + f"{batch.get('request_counts')}")
+                time.sleep(chat.BATCH_POLL_INTERVAL_SEC)
+                response = self.session.get(
+                        API_BASE + f"/batches/{batch['id']}",
+                        headers=headers)
+                response.raise_for_status()
+                batch = response.json()
+
+            print(f"Batch {batch['id']}: {batch['status']}")
+            if batch['status'] != 'completed':
+                return None
+
+            # Successful requests are in the output file and failed ones
+            # in the error file; either may be missing.
+            for file_id in [batch.get('output_file_id'),
+                            batch.get('error_file_id')]:
+                if file_id is None:
+                    continue
+
+                response = self.session.get(
+                        API_BASE + f"/files/{file_id}/content",
+                        headers=headers)
+                response.raise_for_status()
+
+                for line in response.text.splitlines():
+                    if line.strip() == '':
+                        continue
+                    output = json.loads(line)
+                    index = int(output['custom_id'].split('-')[1])
+                    if output.get('response') is None or \
+                            output['response']['status_code'] != 200:
+                        error = output.get('error')
+                        if error is None and \
+                                output.get('response') is not None:
+                            error = output['response']['body'].get('error')
+                        print(f"chunk {index}: {error}")
+                        continue
+                    body = output['response']['body']
+                    results[index] = (
+                        body['choices'][0]['message']['content'],
+                        body['usage'])
+
+        except Exception as e:
+            print(e)
+            return None
+        return results
+
 
 if __name__ == "__main__":
     gpt = GPT(MODEL)
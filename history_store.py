@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Read .env
+load_dotenv()
+
+# Constants
+HISTORY_DB = os.getenv(
+        "HISTORY_DB",
+        f"{os.path.expanduser('~')}/.chat_history.db")
+# Flat text file written by earlier versions
+LEGACY_HISTORY = os.getenv(
+        "OUTPUT_HISTORY",
+        f"{os.path.expanduser('~')}/.chat_history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    model TEXT,
+    source TEXT,
+    prompt TEXT,
+    response TEXT,
+    usage TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    prompt, response, content='history', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, prompt, response)
+        VALUES (new.id, new.prompt, new.response);
+END;
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    time REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, prompt, response)
+        VALUES ('delete', old.id, old.prompt, old.response);
+END;
+"""
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class HistoryStore():
+
+    def __init__(self, path=HISTORY_DB):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        # WAL keeps each insert to a single append to the log file
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def add(self, model, source, prompt, response, usage=None):
+        if usage is not None:
+            usage = json.dumps(usage, ensure_ascii=False)
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO history"
+                + " (time, model, source, prompt, response, usage)"
+                + " VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), model, source, prompt, response, usage))
+
+    def is_imported(self, path):
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM imports WHERE path = ?",
+                                  (os.path.abspath(path),)).fetchone()
+        return row is not None
+
+    # Add entries parsed from a legacy history file in one transaction
+    def import_entries(self, path, entries):
+        timestamp = os.path.getmtime(path)
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO history (time, model, source, prompt, response)"
+                + " VALUES (?, ?, NULL, ?, ?)",
+                [(timestamp, model, prompt, response)
+                 for prompt, model, response in entries])
+            self.db.execute(
+                "INSERT OR REPLACE INTO imports (path, time) VALUES (?, ?)",
+                (os.path.abspath(path), time.time()))
+
+    def find(self, query, limit=20):
+        sql = "SELECT h.id, h.time, h.model, h.source," \
+            + " snippet(history_fts, -1, '[', ']', '...', 16) AS snippet" \
+            + " FROM history_fts JOIN history h" \
+            + " ON h.id = history_fts.rowid" \
+            + " WHERE history_fts MATCH ? ORDER BY rank LIMIT ?"
+        with self.lock:
+            try:
+                return self.db.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Not a valid FTS query; search it as a phrase instead
+                phrase = '"' + query.replace('"', '""') + '"'
+                return self.db.execute(sql, (phrase, limit)).fetchall()
+
+    def get(self, entry_id):
+        with self.lock:
+            return self.db.execute("SELECT * FROM history WHERE id = ?",
+                                   (entry_id,)).fetchone()
+
+    def entries(self):
+        with self.lock:
+            yield from self.db.execute("SELECT * FROM history ORDER BY id")
+
+
+# Shared store, opened on first use
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+# Parse the '--- (user)' / '--- (model)' blocks of a legacy history
+# file into (prompt, model, response) tuples
+def read_legacy_history(path):
+    entries = []
+    header = re.compile(r'^--- \((.+)\)$')
+    role = None
+    lines = []
+
+    def flush():
+        # Every block was written with one trailing blank line
+        text = '\n'.join(lines[:-1] if lines and lines[-1] == '' else lines)
+        if role == 'user':
+            entries.append([text, None, None])
+        elif role is not None and entries and entries[-1][1] is None:
+            entries[-1][1] = role
+            # Failed requests were written as 'None'
+            entries[-1][2] = None if text == 'None' else text
+
+    with open(path, 'r', encoding='utf-8') as file:
+        content = file.read()
+        if content.endswith('\n'):
+            content = content[:-1]
+        for line in content.split('\n'):
+            match = header.match(line)
+            if match:
+                flush()
+                role = match.group(1)
+                lines = []
+            else:
+                lines.append(line)
+    flush()
+
+    return [tuple(entry) for entry in entries if entry[1] is not None]
+
+
+# Hint shown until the legacy history file has been imported
+def legacy_history_notice():
+    if not os.path.exists(LEGACY_HISTORY) \
+            or get_store().is_imported(LEGACY_HISTORY):
+        return None
+    return f"The old history file {LEGACY_HISTORY} is not searchable. " \
+        + "Run 'python history_store.py import' to add it to " \
+        + f"{HISTORY_DB}."
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def print_matches(rows):
+    if len(rows) == 0:
+        print("No matches.")
+    for row in rows:
+        print(f"[{row['id']}] {format_time(row['time'])} ({row['model']})"
+              + (f" {row['source']}" if row['source'] else ""))
+        print(f"    {row['snippet']}")
+
+
+def export(store, file, fmt):
+    for row in store.entries():
+        entry = dict(row)
+        if entry['usage'] is not None:
+            entry['usage'] = json.loads(entry['usage'])
+        if fmt == 'jsonl':
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        else:
+            file.write(f"--- (user) {format_time(entry['time'])}\n")
+            file.write(f"{entry['prompt']}\n")
+            file.write('\n')
+            file.write(f"--- ({entry['model']})\n")
+            file.write(f"{entry['response']}\n")
+            file.write('\n')
+
+
+# CLI Interface
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search and export the chat history.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    find_parser = subparsers.add_parser('find',
+                                        help="Full-text search.")
+    find_parser.add_argument('query', nargs='+')
+    find_parser.add_argument('-n',
+                             '--limit',
+                             type=int,
+                             default=20,
+                             help="Maximum number of matches.")
+
+    show_parser = subparsers.add_parser('show',
+                                        help="Show one entry.")
+    show_parser.add_argument('id', type=int)
+
+    export_parser = subparsers.add_parser('export',
+                                          help="Export all entries.")
+    export_parser.add_argument('-f',
+                               '--format',
+                               choices=['jsonl', 'text'],
+                               default='jsonl')
+    export_parser.add_argument('-o',
+                               '--output',
+                               help="Output file (default: stdout).")
+
+    import_parser = subparsers.add_parser(
+            'import',
+            help="Import a history file written by earlier versions.")
+    import_parser.add_argument('path',
+                               nargs='?',
+                               default=LEGACY_HISTORY,
+                               help="Legacy history file "
+                                    + "(default: OUTPUT_HISTORY or "
+                                    + "~/.chat_history).")
+    import_parser.add_argument('--force',
+                               action='store_true',
+                               help="Import again even if the file was "
+                                    + "imported before.")
+
+    args = parser.parse_args()
+    store = get_store()
+
+    if args.command == 'find':
+        print_matches(store.find(' '.join(args.query), args.limit))
+    elif args.command == 'show':
+        row = store.get(args.id)
+        if row is None:
+            print("No such entry.")
+        else:
+            entry = dict(row)
+            entry['time'] = format_time(entry['time'])
+            if entry['usage'] is not None:
+                entry['usage'] = json.loads(entry['usage'])
+            print(json.dumps(entry, indent=2, ensure_ascii=False))
+    elif args.command == 'import':
+        if store.is_imported(args.path) and args.force is False:
+            print(f"{args.path} was already imported. "
+                  + "Use --force to import it again.")
+        else:
+            entries = read_legacy_history(args.path)
+            store.import_entries(args.path, entries)
+            print(f"Imported {len(entries)} entries from {args.path}.")
+    elif args.output is None:
+        export(store, sys.stdout, args.format)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            export(store, file, args.format)
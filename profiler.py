@@ -0,0 +1,114 @@
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+STAGES = ['fetch', 'extract', 'chunk', 'send', 'log']
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+_profiler = None
+
+
+class Profiler():
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.profile = cProfile.Profile()
+        self.start_time = None
+
+    def start(self):
+        tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self.profile.enable()
+
+    def record(self, name, elapsed, allocated):
+        with self.lock:
+            calls, total, memory = self.stages.get(name, (0, 0.0, 0))
+            self.stages[name] = (calls + 1, total + elapsed,
+                                 memory + allocated)
+
+    def report(self, path):
+        self.profile.disable()
+        wall = time.perf_counter() - self.start_time
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.profile.dump_stats(path + '.prof')
+
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(f"Session: {wall:.3f}s wall, "
+                       + f"{current / 1024:,.1f} KiB traced, "
+                       + f"{peak / 1024:,.1f} KiB peak\n")
+            file.write('\n')
+            file.write('--- (stages) ---\n')
+            file.write("Stage times are wall-clock and may overlap "
+                       + "(prefetch threads, debug log inside send).\n")
+            file.write(f"{'stage':<10}{'calls':>8}{'total s':>12}"
+                       + f"{'avg s':>10}{'% wall':>8}{'net KiB':>12}\n")
+            names = STAGES + sorted(set(self.stages) - set(STAGES))
+            for name in names:
+                calls, total, memory = self.stages.get(name, (0, 0.0, 0))
+                avg = total / calls if calls > 0 else 0.0
+                pct = total / wall * 100 if wall > 0 else 0.0
+                file.write(f"{name:<10}{calls:>8}{total:>12.3f}"
+                           + f"{avg:>10.3f}{pct:>8.1f}"
+                           + f"{memory / 1024:>12,.1f}\n")
+            file.write('\n')
+
+            file.write('--- (cProfile, main thread) ---\n')
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            file.write(stream.getvalue())
+            file.write('\n')
+
+            file.write('--- (tracemalloc) ---\n')
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                file.write(f"{stat}\n")
+
+        print(f"Profile written to {path}")
+
+
+def enable():
+    global _profiler
+    _profiler = Profiler()
+    _profiler.start()
+
+
+def report(path):
+    if _profiler is not None:
+        _profiler.report(path)
+
+
+# Attribute the time and memory spent in the block to a pipeline stage
+@contextmanager
+def stage(name):
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    memory = tracemalloc.get_traced_memory()[0]
+    try:
+        yield
+    finally:
+        _profiler.record(name,
+                         time.perf_counter() - start,
+                         tracemalloc.get_traced_memory()[0] - memory)
+
+
+def staged(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
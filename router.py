@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import chat
+import gemini
+import gpt
+import os
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+PRIMARY = os.getenv("ROUTER_PRIMARY", "gpt")
+HEDGE_DELAY_SEC = float(os.getenv("HEDGE_DELAY_SEC", 10))
+HEDGE_PERCENTILE = int(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = 5
+LATENCY_WINDOW = 100
+
+
+# The conversation is kept in the GPT message format and translated
+# for Gemini when it is sent.
+def to_gpt_message(message):
+    if 'content' in message:
+        return message
+    role = "assistant" if message['role'] == "model" else "user"
+    content = ''.join(part.get('text', '') for part in message['parts'])
+    return {"role": role, "content": content}
+
+
+def to_gemini_message(message):
+    if 'parts' in message:
+        return message
+    role = "model" if message['role'] == "assistant" else "user"
+    return {"role": role, "parts": [{"text": message['content']}]}
+
+
+class Router(chat.Chat):
+
+    def __init__(self, model):
+        super().__init__(model)
+        backends = [
+            (gpt.GPT(gpt.MODEL), to_gpt_message),
+            (gemini.Gemini(gemini.MODEL), to_gemini_message),
+        ]
+        if PRIMARY == "gemini":
+            backends.reverse()
+        self.backends = backends
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # Wait this long for the primary before sending a hedged request
+    def _hedge_delay(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY_SEC
+        samples = sorted(self.latencies)
+        index = min(len(samples) - 1,
+                    int(len(samples) * HEDGE_PERCENTILE / 100))
+        return samples[index]
+
+    def _call(self, backend, message, history, use_history):
+        start = time.monotonic()
+        response, usage = backend._send(message, history, use_history, False)
+        return response, usage, time.monotonic() - start
+
+    def _record_latency(self, future):
+        response, _, elapsed = future.result()
+        if response is not None:
+            self.latencies.append(elapsed)
+
+    def _send(self, message, conversation, use_history, verbose=True):
+
+        futures = {}
+        self.last_model = None
+
+        # Every call gets its own daemon thread, so requests stuck at a
+        # stalled provider neither hold up the hedge nor the exit
+        def submit(backend, convert):
+            history = None
+            if conversation is not None:
+                history = deque(convert(m) for m in conversation)
+            future = chat.submit_daemon(
+                    self._call, backend, message, history, use_history)
+            futures[future] = backend
+            return future
+
+        primary, secondary = self.backends
+
+        submit(*primary).add_done_callback(self._record_latency)
+        done, _ = wait(futures, timeout=self._hedge_delay())
+        if len(done) == 0:
+            submit(*secondary)
+
+        winner = None
+        pending = set(futures)
+        while winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response, usage, _ = future.result()
+                if response is not None:
+                    winner = futures[future]
+                    break
+                # Fail over when the primary returns an error
+                if len(futures) == 1:
+                    pending.add(submit(*secondary))
+            if winner is None and len(pending) == 0:
+                if verbose is True:
+                    print("All backends failed.")
+                return None, None
+
+        self.last_model = winner.MODEL
+
+        if verbose is True:
+            print(f"({winner.MODEL}): ", end="")
+            print(response, end="")
+
+        if conversation is not None:
+            conversation.append({"role": "user", "content": message.strip()})
+            conversation.append({"role": "assistant", "content": response})
+
+        return response, usage
+
+    def _send_image(self, message, mime_type, base64_image,
+                    verbose=True):
+        self.last_model = None
+        for backend, _ in self.backends:
+            response, usage = backend._send_image(
+                    message, mime_type, base64_image, verbose)
+            if response is not None:
+                self.last_model = backend.MODEL
+                return response, usage
+        return None, None
+
+    def _send_batch(self, messages):
+        self.last_model = None
+        for backend, _ in self.backends:
+            results = backend._send_batch(messages)
+            if results is not None:
+                self.last_model = backend.MODEL
+                return results
+        return None
+
+
+# CLI Interface
+if __name__ == "__main__":
+    router = Router(f"router:{PRIMARY}")
+    router.main()